@@ -0,0 +1,22 @@
+# pipeline_runner.py
+"""
+Corre el pipeline completo en un proceso propio.
+Lo lanza server._start_background_job; también sirve a mano:
+
+  python pipeline_runner.py <started_by> <forced 0|1> [short|normal]
+"""
+
+import sys
+
+from server import _run_pipeline_job
+
+
+def main():
+    started_by = sys.argv[1] if len(sys.argv) > 1 else "manual"
+    forced = len(sys.argv) > 2 and sys.argv[2] == "1"
+    profile = sys.argv[3] if len(sys.argv) > 3 and sys.argv[3] in ("short", "normal") else None
+    _run_pipeline_job(started_by, forced, profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,40 @@
 # server.py
 
+import atexit
 import datetime as dt
 import fcntl
+import hashlib
+import hmac
+import html
 import json
+import mmap
 import os
+import re
+import struct
 import subprocess
+import sys
 import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
-from flask import (Flask, jsonify, redirect, render_template_string, request,
-                   session, url_for)
+from flask import Flask, jsonify, redirect, request, session, url_for
 from werkzeug.security import check_password_hash
 
+try:
+    import orjson  # opcional: JSON en C, más rápido
+except ImportError:
+    orjson = None
+
 # =========================
 # Flask app
 # =========================
 app = Flask(__name__)
+app.json.compact = True
+app.json.sort_keys = False
 
 # =========================
 # Auth (sin DB)
@@ -49,16 +66,43 @@ LOG_FILE = RUNTIME_DIR / "last_run.log"
 MAX_LOG_BYTES = int(os.getenv("MAX_LOG_BYTES", "1000000"))  # 1MB
 TAIL_BYTES = int(os.getenv("TAIL_BYTES", "250000"))  # 250KB
 LOG_TO_STDOUT = os.getenv("LOG_TO_STDOUT", "0") == "1"
+LOG_BUFFER_BYTES = 64 * 1024
+LOG_FLUSH_SECONDS = float(os.getenv("LOG_FLUSH_SECONDS", "2"))
 
 BASE_DIR = Path(__file__).resolve().parent
 ENAP_FILE = BASE_DIR / "sources" / "enap_semana.json"
 LATEST_JSON = BASE_DIR / "data" / "latest.json"
+PIPELINE_RUNNER = BASE_DIR / "pipeline_runner.py"
+
+# JSON compacto por defecto; FC_PRETTY_JSON=1 para debug
+PRETTY_JSON = os.getenv("FC_PRETTY_JSON") == "1"
+
+UPLOADS_KEEP = 50
+
+# render_panel y voice corren en paralelo (PIPELINE_PARALLEL=0 para serializar si falta RAM)
+PIPELINE_PARALLEL = os.getenv("PIPELINE_PARALLEL", "1") == "1"
 
 IS_RENDER = bool(os.getenv("RENDER")) or bool(os.getenv("RENDER_SERVICE_ID"))
 SHORT_ONLY = os.getenv("SHORT_ONLY", "1" if IS_RENDER else "0") == "1"
 
 _thread_guard = threading.Lock()
-_background_thread = None
+_background_proc: Optional[subprocess.Popen] = None
+
+# log bufferizado (un solo open por proceso)
+_log_lock = threading.Lock()
+_log_fh = None
+_log_flushed_at = 0.0
+
+# cache de login OK (evita repetir PBKDF2 para el mismo admin)
+AUTH_CACHE_TTL = 300.0
+_auth_cache: Dict[str, object] = {"fp": b"", "expires": 0.0}
+
+
+def _password_fp(pw: str) -> bytes:
+    key = app.secret_key if isinstance(app.secret_key, bytes) else str(app.secret_key).encode("utf-8")
+    # blake2b acepta key de hasta 64 bytes
+    key = hashlib.sha256(key).digest()
+    return hashlib.blake2b(pw.encode("utf-8"), key=key, digest_size=16).digest()
 
 
 def _password_ok(pw: str) -> bool:
@@ -66,7 +110,14 @@ def _password_ok(pw: str) -> bool:
     if not pw:
         return False
     if ADMIN_PASSWORD_HASH:
-        return check_password_hash(ADMIN_PASSWORD_HASH, pw)
+        fp = _password_fp(pw)
+        if time.monotonic() < _auth_cache["expires"] and hmac.compare_digest(fp, _auth_cache["fp"]):
+            return True
+        ok = check_password_hash(ADMIN_PASSWORD_HASH, pw)
+        if ok:
+            _auth_cache["fp"] = fp
+            _auth_cache["expires"] = time.monotonic() + AUTH_CACHE_TTL
+        return ok
     if ADMIN_PASSWORD:
         return pw == ADMIN_PASSWORD
     return False
@@ -82,6 +133,23 @@ def login_required(fn):
     return wrapper
 
 
+def _json_loads(raw: bytes):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _json_dumps(obj) -> bytes:
+    if orjson is not None:
+        opt = orjson.OPT_NON_STR_KEYS
+        if PRETTY_JSON:
+            opt |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=opt)
+    if PRETTY_JSON:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
 def _tz_now() -> dt.datetime:
     try:
         from zoneinfo import ZoneInfo
@@ -90,20 +158,82 @@ def _tz_now() -> dt.datetime:
         return dt.datetime.now()
 
 
+# cache de JSON leídos: path -> ((st_ino, st_mtime_ns, st_size), dict)
+# los writers usan os.replace, así que cualquier escritura cambia la clave.
+_json_cache: Dict[str, Tuple[Tuple[int, int, int], Dict]] = {}
+
+
+def _read_json_cached(path: Path) -> Dict:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return {}
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    hit = _json_cache.get(str(path))
+    if hit and hit[0] == key:
+        return dict(hit[1])
+    data = _json_loads(path.read_bytes())
+    _json_cache[str(path)] = (key, data)
+    return dict(data)
+
+
 def _read_state() -> Dict:
-    if STATE_FILE.exists():
+    try:
+        return _read_json_cached(STATE_FILE)
+    except Exception:
+        return {}
+
+
+def _atomic_write_bytes(path: Path, data: bytes) -> None:
+    """
+    tmp + fsync + os.replace + fsync del directorio: tras un crash queda el archivo
+    viejo o el nuevo completo, nunca uno vacío.
+    """
+    tmp = path.with_suffix(".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
+
+    dfd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(dfd)
+    finally:
+        os.close(dfd)
+
+
+# última escritura por path: ((st_ino, st_mtime_ns, st_size), digest de los bytes)
+_last_written: Dict[str, Tuple[Tuple[int, int, int], bytes]] = {}
+
+
+def _write_json_atomic(path: Path, data: Dict) -> None:
+    raw = _json_dumps(data)
+    digest = hashlib.blake2b(raw, digest_size=16).digest()
+
+    # no-op si el archivo sigue siendo exactamente lo último que escribimos
+    prev = _last_written.get(str(path))
+    if prev and prev[1] == digest:
         try:
-            return json.loads(STATE_FILE.read_text(encoding="utf-8"))
-        except Exception:
-            return {}
-    return {}
+            st = path.stat()
+            if prev[0] == (st.st_ino, st.st_mtime_ns, st.st_size):
+                return
+        except FileNotFoundError:
+            pass
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _atomic_write_bytes(path, raw)
+
+    st = path.stat()
+    _last_written[str(path)] = ((st.st_ino, st.st_mtime_ns, st.st_size), digest)
 
 
 def _write_state(state: Dict) -> None:
-    RUNTIME_DIR.mkdir(parents=True, exist_ok=True)
-    tmp = STATE_FILE.with_suffix(".tmp")
-    tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
-    tmp.replace(STATE_FILE)
+    _write_json_atomic(STATE_FILE, state)
 
 
 def _truncate_log_if_needed() -> None:
@@ -123,70 +253,130 @@ def _truncate_log_if_needed() -> None:
         lines = text.splitlines()
         out = "\n".join(lines[-2000:]) + "\n"
 
-        tmp = LOG_FILE.with_suffix(".tmp")
-        tmp.write_text(out, encoding="utf-8")
-        tmp.replace(LOG_FILE)
+        _atomic_write_bytes(LOG_FILE, out.encode("utf-8"))
     except Exception:
         return
 
 
+def _log_handle():
+    # llamar con _log_lock tomado
+    global _log_fh
+    if _log_fh is None:
+        RUNTIME_DIR.mkdir(parents=True, exist_ok=True)
+        _log_fh = open(LOG_FILE, "ab", buffering=LOG_BUFFER_BYTES)
+    return _log_fh
+
+
+def _flush_log() -> None:
+    """
+    Vacía el buffer del log a disco y recorta el archivo si pasó MAX_LOG_BYTES.
+    """
+    global _log_fh, _log_flushed_at
+    with _log_lock:
+        if _log_fh is None:
+            return
+        try:
+            _log_fh.flush()
+            _log_flushed_at = time.monotonic()
+            if os.fstat(_log_fh.fileno()).st_size <= MAX_LOG_BYTES:
+                return
+            # el recorte reemplaza el archivo: cerramos y se reabre en el próximo write
+            _log_fh.close()
+            _log_fh = None
+            _truncate_log_if_needed()
+        except Exception:
+            return
+
+
 def _append_log(line: str) -> None:
     """
     Guarda en archivo y (opcional) también imprime a stdout para Render logs.
     Esto NO debería reventar RAM: solo streaming.
+    Escribe a un buffer de LOG_BUFFER_BYTES; se vacía con _flush_log().
     """
-    RUNTIME_DIR.mkdir(parents=True, exist_ok=True)
     s = (line or "").rstrip()
     if not s:
         return
-    with LOG_FILE.open("a", encoding="utf-8") as f:
-        f.write(s + "\n")
-    _truncate_log_if_needed()
+    with _log_lock:
+        _log_handle().write(s.encode("utf-8") + b"\n")
+        stale = time.monotonic() - _log_flushed_at > LOG_FLUSH_SECONDS
+    if stale:
+        # que /admin siga viendo líneas nuevas durante pasos largos
+        _flush_log()
 
     if LOG_TO_STDOUT:
         print(s, flush=True)
 
 
+atexit.register(_flush_log)
+
+
 def _tail_log(n_lines: int = 250) -> str:
+    """
+    Últimas n_lines del log vía mmap de solo lectura (sin copiar a user-space
+    más que el tramo final). Busca hacia atrás como máximo TAIL_BYTES.
+    """
     try:
-        if not LOG_FILE.exists():
-            return ""
-        sz = LOG_FILE.stat().st_size
-        if sz <= 0:
-            return ""
-        read_bytes = min(TAIL_BYTES, sz)
         with LOG_FILE.open("rb") as f:
-            f.seek(-read_bytes, os.SEEK_END)
-            chunk = f.read(read_bytes)
+            sz = os.fstat(f.fileno()).st_size
+            if sz <= 0:
+                return ""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                floor = max(0, sz - TAIL_BYTES)
+                end = sz
+                if mm[sz - 1] != 0x0A:
+                    # última línea a medio escribir (flush parcial del buffer): se descarta
+                    nl = mm.rfind(b"\n", floor, sz)
+                    end = nl + 1 if nl >= 0 else sz
+
+                start = floor
+                pos = end - 1
+                for _ in range(n_lines):
+                    nl = mm.rfind(b"\n", floor, pos)
+                    if nl < 0:
+                        start = floor
+                        break
+                    start = nl + 1
+                    pos = nl
+                chunk = mm[start:end]
         text = chunk.decode("utf-8", errors="ignore")
-        lines = text.splitlines()
-        return "\n".join(lines[-n_lines:])
+        return "\n".join(text.splitlines())
     except Exception:
         return ""
 
 
 def _read_latest_json() -> Dict:
     try:
-        if not LATEST_JSON.exists():
-            return {}
-        return json.loads(LATEST_JSON.read_text(encoding="utf-8"))
+        return _read_json_cached(LATEST_JSON)
     except Exception:
         return {}
 
 
-def _run(cmd: List[str], extra_env: Optional[Dict[str, str]] = None) -> Tuple[int, str, str]:
-    env = os.environ.copy()
-    if extra_env:
-        env.update(extra_env)
+# env base de los pasos, armado una vez (el proceso no modifica os.environ)
+_CHILD_ENV: Dict[str, str] = dict(os.environ)
 
+
+def _run(cmd: List[str], extra_env: Optional[Dict[str, str]] = None, tag: Optional[str] = None) -> Tuple[int, str, str]:
+    """
+    Ejecuta un paso streameando stdout+stderr línea a línea al log.
+    Con `tag` cada línea sale como "[tag] ..." (pasos en paralelo escriben al mismo log).
+    Solo se retienen en memoria las líneas UPLOAD_RESULT/UPLOAD_SKIPPED (van en `out`);
+    `err` queda vacío porque stderr viene mezclado en stdout.
+    """
+    env = {**_CHILD_ENV, **extra_env} if extra_env else _CHILD_ENV
+
+    # close_fds/pass_fds explícitos: el hijo no hereda el lock ni sockets del worker.
+    # start_new_session: cada paso queda en su propio grupo de procesos.
     p = subprocess.Popen(
         cmd,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
         text=True,
         bufsize=1,
-        universal_newlines=True,
         env=env,
+        close_fds=True,
+        pass_fds=(),
+        start_new_session=True,
     )
 
     capture_lines: List[str] = []
@@ -195,7 +385,7 @@ def _run(cmd: List[str], extra_env: Optional[Dict[str, str]] = None) -> Tuple[in
             s = (line or "").rstrip()
             if not s:
                 continue
-            _append_log(s)
+            _append_log(f"[{tag}] {s}" if tag else s)
 
             # capturamos solo marcadores chicos, no todo (memoria segura)
             if s.startswith("UPLOAD_RESULT ") or s.startswith("UPLOAD_SKIPPED "):
@@ -205,15 +395,68 @@ def _run(cmd: List[str], extra_env: Optional[Dict[str, str]] = None) -> Tuple[in
     return code, "\n".join(capture_lines), ""
 
 
+# Linux: locks OFD (ligados al open file description, no al proceso).
+# Otros (macOS dev): flock clásico.
+_HAS_OFD = hasattr(fcntl, "F_OFD_SETLK")
+_FLOCK_FMT = "hhqqi4x"  # struct flock: l_type, l_whence, l_start, l_len, l_pid
+
+# fd del lock vivo a nivel módulo: que un close() accidental no lo suelte
+_lock_fp = None
+
+
+def _flock_struct(l_type: int) -> bytes:
+    return struct.pack(_FLOCK_FMT, l_type, os.SEEK_SET, 0, 0, 0)
+
+
 def _acquire_lock_nonblocking():
+    global _lock_fp
     RUNTIME_DIR.mkdir(parents=True, exist_ok=True)
     fp = LOCK_FILE.open("w")
     try:
-        fcntl.flock(fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-        return fp
-    except BlockingIOError:
+        if _HAS_OFD:
+            fcntl.fcntl(fp.fileno(), fcntl.F_OFD_SETLK, _flock_struct(fcntl.F_WRLCK))
+        else:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
         fp.close()
         return None
+    _lock_fp = fp
+    return fp
+
+
+def _release_lock(fp) -> None:
+    global _lock_fp
+    try:
+        if _HAS_OFD:
+            fcntl.fcntl(fp.fileno(), fcntl.F_OFD_SETLK, _flock_struct(fcntl.F_UNLCK))
+        else:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+    except Exception:
+        pass
+    try:
+        fp.close()
+    except Exception:
+        pass
+    _lock_fp = None
+
+
+def _lock_held_elsewhere() -> bool:
+    """
+    Probe sin tomar el lock (F_OFD_GETLK). Sin OFD devuelve False y decide el job.
+    """
+    if not _HAS_OFD:
+        return False
+    try:
+        fd = os.open(LOCK_FILE, os.O_RDWR)
+    except OSError:
+        return False
+    try:
+        res = fcntl.fcntl(fd, fcntl.F_OFD_GETLK, _flock_struct(fcntl.F_WRLCK))
+        return struct.unpack(_FLOCK_FMT, res)[0] != fcntl.F_UNLCK
+    except Exception:
+        return False
+    finally:
+        os.close(fd)
 
 
 # =========================
@@ -235,21 +478,27 @@ def _parse_run_minutes() -> List[int]:
     return out or [0]
 
 
+RUN_SLOTS = _parse_run_minutes()
+
+# ventanas precalculadas en minuto-del-día: (inicio, fin_exclusivo, slot).
+# la ventana no cruza a la hora siguiente.
+_HOUR_START = RUN_HOUR * 60
+_SLOT_WINDOWS: List[Tuple[int, int, int]] = [
+    (_HOUR_START + m, min(_HOUR_START + m + max(1, RUN_WINDOW_MINUTES), _HOUR_START + 60), m)
+    for m in RUN_SLOTS
+]
+
+
 def _match_slot(now: dt.datetime) -> Optional[int]:
-    if now.hour != RUN_HOUR:
-        return None
-    win = max(1, RUN_WINDOW_MINUTES)
-    for m in _parse_run_minutes():
-        if m <= now.minute < (m + win):
+    mod = now.hour * 60 + now.minute
+    for start, end, m in _SLOT_WINDOWS:
+        if start <= mod < end:
             return m
     return None
 
 
 def _within_run_window(now: dt.datetime) -> bool:
-    is_weekday = now.weekday() <= 4  # lun-vie
-    if not is_weekday:
-        return False
-    return _match_slot(now) is not None
+    return now.weekday() <= 4 and _match_slot(now) is not None  # lun-vie
 
 
 def _slot_profile(slot_minute: int) -> str:
@@ -260,13 +509,28 @@ def _slot_profile(slot_minute: int) -> str:
     return "short"
 
 
+def _run_key(now: dt.datetime, slot: int) -> str:
+    return f"{now.date().isoformat()}@{RUN_HOUR:02d}:{slot:02d}"
+
+
+# último run del cron exitoso visto por este proceso. Solo avanza, así que un
+# probe repetido en el mismo slot se responde sin tocar state.json.
+_last_success: Dict[str, Optional[str]] = {"run_key": None, "date": None}
+
+
+def _remember_success(state: Dict) -> None:
+    key = (state.get("last_success_run_key") or "").strip()
+    if key:
+        _last_success["run_key"] = key
+        _last_success["date"] = state.get("last_success_date")
+
+
 def _should_run(now: dt.datetime, state: Dict) -> Tuple[bool, str]:
     slot = _match_slot(now)
     if slot is None:
         return False, "outside_schedule"
 
-    today_iso = now.date().isoformat()
-    run_key = f"{today_iso}@{RUN_HOUR:02d}:{slot:02d}"
+    run_key = _run_key(now, slot)
 
     last_key = (state.get("last_success_run_key") or "").strip()
     if last_key == run_key:
@@ -289,24 +553,55 @@ def _pipeline_steps():
     ]
 
 
+# etapas del pipeline: los pasos de una misma etapa solo dependen de las anteriores
+# (render_panel y voice solo necesitan latest.json; make_video necesita ambos)
+_PIPELINE_STAGES = [["fetch_to_json"], ["render_panel", "voice"], ["make_video"], ["upload"]]
+
+
+def _pipeline_stages() -> List[List[Tuple[str, List[str]]]]:
+    steps = dict(_pipeline_steps())
+    stages = [[n for n in stage if n in steps] for stage in _PIPELINE_STAGES]
+    if not PIPELINE_PARALLEL:
+        stages = [[n] for stage in stages for n in stage]
+    return [[(n, steps[n]) for n in stage] for stage in stages if stage]
+
+
+def _step_env(name: str, profile: str) -> Optional[Dict[str, str]]:
+    extra_env: Dict[str, str] = {}
+
+    if profile == "short":
+        if name == "make_video":
+            extra_env.setdefault("GENERATE_FULL_VIDEO", "0")
+            extra_env.setdefault("GENERATE_SHORT_VIDEO", "1")
+        if name == "upload":
+            extra_env.setdefault("UPLOAD_NORMAL", "0")
+            extra_env.setdefault("UPLOAD_SHORT", "1")
+
+    elif profile == "normal":
+        if name == "make_video":
+            extra_env.setdefault("GENERATE_FULL_VIDEO", "1")
+            extra_env.setdefault("GENERATE_SHORT_VIDEO", "0")
+        if name == "upload":
+            extra_env.setdefault("UPLOAD_NORMAL", "1")
+            extra_env.setdefault("UPLOAD_SHORT", "0")
+
+    return extra_env if extra_env else None
+
+
+# una pasada sobre todo el texto: solo se tocan las líneas marcador
+_UPLOAD_RE = re.compile(r"^[ \t]*UPLOAD_(RESULT|SKIPPED) ([^\n]*)$", re.M)
+_UPLOAD_KV = re.compile(r"([^\s=]+)=(\S*)")
+
+
 def _parse_upload_results(stdout: str, stderr: str) -> List[Dict]:
     results = []
     text = (stdout or "") + "\n" + (stderr or "")
-    for line in text.splitlines():
-        line = line.strip()
-        if not (line.startswith("UPLOAD_RESULT ") or line.startswith("UPLOAD_SKIPPED ")):
-            continue
-
-        kind = "result" if line.startswith("UPLOAD_RESULT ") else "skipped"
-        payload = line.split(" ", 1)[1].strip() if " " in line else ""
-        parts = payload.split()
+    for rec in _UPLOAD_RE.finditer(text):
+        kind = "result" if rec.group(1) == "RESULT" else "skipped"
 
         d = {"_kind": kind}
-        for p in parts:
-            if "=" not in p:
-                continue
-            k, v = p.split("=", 1)
-            d[k.strip()] = v.strip()
+        for m in _UPLOAD_KV.finditer(rec.group(2)):
+            d[m.group(1)] = m.group(2)
 
         if d.get("id"):
             vid = d["id"]
@@ -320,6 +615,10 @@ def _parse_upload_results(stdout: str, stderr: str) -> List[Dict]:
 
 def _run_pipeline_job(started_by: str, forced: bool, forced_profile: Optional[str] = None):
     now = _tz_now()
+    lock_fp = _acquire_lock_nonblocking()
+
+    # se lee después del lock: un job que terminó justo antes ya dejó su state final
+    # (uploads, last_success_run_key) y no se pisa con una copia vieja
     state = _read_state()
 
     slot = state.get("_pending_slot")
@@ -332,143 +631,197 @@ def _run_pipeline_job(started_by: str, forced: bool, forced_profile: Optional[st
             slot_int = 0
         profile = _slot_profile(slot_int)
 
-    run_key = (state.get("_pending_run_key") or "").strip() or f"{now.date().isoformat()}@{RUN_HOUR:02d}:{int(slot or 0):02d}"
-
-    state["last_started_at"] = now.isoformat(timespec="seconds")
-    state["last_started_by"] = started_by
-    state["last_forced"] = bool(forced)
-    state["last_status"] = "running"
-    state["last_error_step"] = None
-    state["last_profile"] = profile
-    _write_state(state)
+    run_key = (state.get("_pending_run_key") or "").strip() or _run_key(now, int(slot or 0))
 
+    started_at = now.isoformat(timespec="seconds")
     _append_log(
-        f"\n=== START {state['last_started_at']} by={started_by} forced={forced} profile={profile} run_key={run_key} ==="
+        f"\n=== START {started_at} by={started_by} forced={forced} profile={profile} run_key={run_key} ==="
     )
 
-    lock_fp = _acquire_lock_nonblocking()
     if not lock_fp:
         _append_log("LOCK: already running, exiting.")
-        st = _read_state()
-        st["last_status"] = "skipped_already_running"
-        st["last_finished_at"] = _tz_now().isoformat(timespec="seconds")
-        _write_state(st)
+        _flush_log()
+        state["last_status"] = "skipped_already_running"
+        state["last_finished_at"] = _tz_now().isoformat(timespec="seconds")
+        _write_state(state)
         return
 
-    try:
-        for name, cmd in _pipeline_steps():
-            _append_log(f"[STEP] {name}: {' '.join(cmd)}")
-
-            extra_env: Dict[str, str] = {}
-
-            if profile == "short":
-                if name == "make_video":
-                    extra_env.setdefault("GENERATE_FULL_VIDEO", "0")
-                    extra_env.setdefault("GENERATE_SHORT_VIDEO", "1")
-                if name == "upload":
-                    extra_env.setdefault("UPLOAD_NORMAL", "0")
-                    extra_env.setdefault("UPLOAD_SHORT", "1")
+    # con el lock tomado solo este job escribe state: `state` es la copia autoritativa
+    state["last_started_at"] = started_at
+    state["last_started_by"] = started_by
+    state["last_forced"] = bool(forced)
+    state["last_status"] = "running"
+    state["last_error_step"] = None
+    state["last_profile"] = profile
+    _write_state(state)
 
-            elif profile == "normal":
-                if name == "make_video":
-                    extra_env.setdefault("GENERATE_FULL_VIDEO", "1")
-                    extra_env.setdefault("GENERATE_SHORT_VIDEO", "0")
+    try:
+        for stage in _pipeline_stages():
+            for name, cmd in stage:
+                _append_log(f"[STEP] {name}: {' '.join(cmd)}")
+            # el header del paso llega a disco ya: /admin muestra qué está corriendo
+            _flush_log()
+
+            if len(stage) == 1:
+                name, cmd = stage[0]
+                results = [_run(cmd, extra_env=_step_env(name, profile))]
+            else:
+                # pasos independientes (render + voz) en paralelo; cada uno es un subproceso
+                with ThreadPoolExecutor(max_workers=len(stage)) as pool:
+                    futures = [pool.submit(_run, cmd, _step_env(name, profile), name) for name, cmd in stage]
+                    results = [f.result() for f in futures]
+            _flush_log()
+
+            for (name, _cmd), (code, out, err) in zip(stage, results):
                 if name == "upload":
-                    extra_env.setdefault("UPLOAD_NORMAL", "1")
-                    extra_env.setdefault("UPLOAD_SHORT", "0")
-
-            code, out, err = _run(cmd, extra_env=extra_env if extra_env else None)
-
-            if name == "upload":
-                uploads = _parse_upload_results(out, err)
-                if uploads:
-                    st = _read_state()
-                    st.setdefault("uploads", [])
-                    ts = _tz_now().isoformat(timespec="seconds")
-                    for u in uploads:
-                        u["ts"] = ts
-                    st["uploads"] = (uploads + st["uploads"])[:50]
-                    _write_state(st)
-
-            if code != 0:
-                st = _read_state()
-                st["last_status"] = "failed"
-                st["last_error_step"] = name
-                st["last_finished_at"] = _tz_now().isoformat(timespec="seconds")
-                _write_state(st)
-                _append_log(f"=== FAIL step={name} code={code} ===")
-                return
+                    uploads = _parse_upload_results(out, err)
+                    if uploads:
+                        ts = _tz_now().isoformat(timespec="seconds")
+                        # más nuevo primero; maxlen descarta los más viejos
+                        dq = deque(state.get("uploads") or [], maxlen=UPLOADS_KEEP)
+                        for u in reversed(uploads):
+                            u["ts"] = ts
+                            dq.appendleft(u)
+                        state["uploads"] = list(dq)
+                        # se persiste con el _write_state final del job (éxito o fallo)
+
+                if code != 0:
+                    state["last_status"] = "failed"
+                    state["last_error_step"] = name
+                    state["last_finished_at"] = _tz_now().isoformat(timespec="seconds")
+                    _write_state(state)
+                    _append_log(f"=== FAIL step={name} code={code} ===")
+                    return
 
         finished = _tz_now()
-        st = _read_state()
-        st["last_status"] = "success"
-        st["last_finished_at"] = finished.isoformat(timespec="seconds")
-        st["last_success_date"] = finished.strftime("%d-%m-%Y")
+        state["last_status"] = "success"
+        state["last_finished_at"] = finished.isoformat(timespec="seconds")
+        state["last_success_date"] = finished.strftime("%d-%m-%Y")
 
         # ✅ CLAVE: si fue FORZADO, NO bloquea el cron de las 07:00
         if started_by == "schedule":
-            st["last_success_run_key"] = run_key
+            state["last_success_run_key"] = run_key
+            _remember_success(state)
 
         # limpia pending
-        st.pop("_pending_slot", None)
-        st.pop("_pending_run_key", None)
-        _write_state(st)
-        _append_log(f"=== SUCCESS {st['last_finished_at']} ===")
+        state.pop("_pending_slot", None)
+        state.pop("_pending_run_key", None)
+        _write_state(state)
+        _append_log(f"=== SUCCESS {state['last_finished_at']} ===")
 
     finally:
-        try:
-            fcntl.flock(lock_fp.fileno(), fcntl.LOCK_UN)
-        except Exception:
-            pass
-        try:
-            lock_fp.close()
-        except Exception:
-            pass
+        _flush_log()
+        _release_lock(lock_fp)
 
 
-def _start_background_job(started_by: str, forced: bool, forced_profile: Optional[str] = None) -> bool:
-    global _background_thread
+def _reap_background_job(proc: subprocess.Popen) -> None:
+    # el runner es hijo de este worker: sin wait() queda zombie hasta el próximo /run
+    proc.wait()
+    global _background_proc
     with _thread_guard:
-        if _background_thread and _background_thread.is_alive():
-            return False
-        _background_thread = threading.Thread(
-            target=_run_pipeline_job,
-            args=(started_by, forced, forced_profile),
-            daemon=True,
-        )
-        _background_thread.start()
-        return True
+        if _background_proc is proc:
+            _background_proc = None
+
+
+def _start_background_job(started_by: str, forced: bool, forced_profile: Optional[str] = None) -> Tuple[bool, str]:
+    """
+    Lanza el pipeline en un proceso aparte (pipeline_runner.py), en su propia sesión:
+    sobrevive al reciclado del worker de gunicorn y no compite por el GIL con las rutas.
+    La exclusión entre workers la sigue dando el lock de _run_pipeline_job.
+    Retorna (started, reason).
+    """
+    global _background_proc
+    with _thread_guard:
+        if _background_proc and _background_proc.poll() is None:
+            return False, "already_running_in_process"
+        try:
+            proc = subprocess.Popen(
+                [sys.executable, str(PIPELINE_RUNNER), started_by, "1" if forced else "0", forced_profile or ""],
+                stdin=subprocess.DEVNULL,
+                close_fds=True,
+                start_new_session=True,
+            )
+        except OSError as e:
+            _append_log(f"SPAWN_FAILED runner error={e}")
+            return False, f"spawn_failed: {e}"
+        _background_proc = proc
+
+    threading.Thread(target=_reap_background_job, args=(proc,), name="runner-reaper", daemon=True).start()
+    return True, "started"
 
 
 # =========================
 # Fuel file helpers
 # =========================
 def _read_enap() -> Dict:
-    if ENAP_FILE.exists():
-        try:
-            return json.loads(ENAP_FILE.read_text(encoding="utf-8"))
-        except Exception:
-            return {}
-    return {}
+    try:
+        return _read_json_cached(ENAP_FILE)
+    except Exception:
+        return {}
 
 
 def _write_enap(data: Dict) -> None:
-    ENAP_FILE.parent.mkdir(parents=True, exist_ok=True)
-    tmp = ENAP_FILE.with_suffix(".tmp")
-    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-    tmp.replace(ENAP_FILE)
+    _write_json_atomic(ENAP_FILE, data)
+
+
+_INT_TRANS = str.maketrans("", "", ".,")
 
 
 def _safe_int(x: str) -> Optional[int]:
-    x = (x or "").strip().replace(".", "").replace(",", "")
+    x = (x or "").strip().translate(_INT_TRANS)
     if not x:
         return None
+    # caso normal (entero simple): sin float() ni excepciones
+    if (x[1:] if x[0] in "+-" else x).isdecimal():
+        return int(x)
+    # notación científica u otros formatos raros
     try:
         return int(float(x))
     except Exception:
         return None
 
 
+def _render(tpl, **context) -> str:
+    # templates compilados una vez al importar; aquí solo se inyecta el contexto de Flask
+    app.update_template_context(context)
+    return tpl.render(context)
+
+
+# =========================
+# Conditional GET (ETag / Last-Modified)
+# =========================
+# cambia con cada deploy/config: evita 304 con HTML o config viejos
+_ETAG_SALT = hashlib.blake2b(
+    Path(__file__).read_bytes() + f"{RUN_TOKEN}|{SHORT_ONLY}|{TZ_NAME}".encode("utf-8"),
+    digest_size=4,
+).hexdigest()
+
+
+def _etag_for(*paths: Path) -> Tuple[str, float]:
+    parts = [_ETAG_SALT]
+    newest = 0
+    for path in paths:
+        try:
+            st = path.stat()
+            parts.append(f"{st.st_mtime_ns:x}-{st.st_size:x}")
+            newest = max(newest, st.st_mtime_ns)
+        except OSError:
+            parts.append("0")
+    return "-".join(parts), newest / 1e9
+
+
+def _with_validators(resp, tag: str, mtime: float):
+    resp.set_etag(tag, weak=True)
+    if mtime:
+        resp.last_modified = mtime
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+def _not_modified(tag: str, mtime: float):
+    return _with_validators(app.response_class(status=304), tag, mtime)
+
+
 # =========================
 # Routes: base
 # =========================
@@ -479,26 +832,35 @@ def home():
     return redirect(url_for("login"))
 
 
+# respuesta fija y compartida: el healthcheck de Render pega cada pocos segundos.
+# Ojo: /health no debe tocar session ni tener after_request que muten headers.
+_HEALTH_RESP = app.response_class(b'{"ok":true}', status=200, mimetype="application/json")
+
+
 @app.get("/health")
 def health():
-    return jsonify({"ok": True})
+    return _HEALTH_RESP
 
 
 @app.get("/status")
 def status():
+    tag, mtime = _etag_for(STATE_FILE)
+    if request.if_none_match.contains_weak(tag):
+        return _not_modified(tag, mtime)
     state = _read_state()
-    return jsonify(
+    resp = jsonify(
         {
             "ok": True,
             "tz": TZ_NAME,
             "run_hour": RUN_HOUR,
-            "run_minutes": _parse_run_minutes(),
+            "run_minutes": RUN_SLOTS,
             "run_window_minutes": RUN_WINDOW_MINUTES,
             "short_only": SHORT_ONLY,
             "state": state,
             "log_file": str(LOG_FILE),
         }
     )
+    return _with_validators(resp, tag, mtime)
 
 
 @app.get("/run")
@@ -508,7 +870,17 @@ def run_daily():
         return jsonify({"ok": False, "error": "unauthorized"}), 401
 
     now = _tz_now()
-    state = _read_state()
+
+    # otro worker/proceso ya corre el pipeline: ni thread ni state
+    if _lock_held_elsewhere():
+        return jsonify(
+            {
+                "ok": True,
+                "started": False,
+                "reason": "already_running",
+                "now": now.isoformat(timespec="seconds"),
+            }
+        )
 
     forced = (request.args.get("force") == "1") and ALLOW_FORCE
 
@@ -517,20 +889,30 @@ def run_daily():
         forced_profile = None
 
     if forced:
-        started = _start_background_job(started_by="force", forced=True, forced_profile=forced_profile)
+        started, reason = _start_background_job(started_by="force", forced=True, forced_profile=forced_profile)
         return jsonify(
             {
                 "ok": True,
                 "forced": True,
                 "started": started,
+                "reason": reason,
                 "now": now.isoformat(timespec="seconds"),
                 "profile": forced_profile or "auto",
             }
         )
 
+    slot = _match_slot(now)
+    if slot is not None and _last_success["run_key"] == _run_key(now, slot):
+        state = {
+            "last_success_date": _last_success["date"],
+            "last_success_run_key": _last_success["run_key"],
+        }
+    else:
+        state = _read_state()
+        _remember_success(state)
+
     should, reason = _should_run(now, state)
     if not should:
-        slot = _match_slot(now)
         return jsonify(
             {
                 "ok": True,
@@ -547,12 +929,12 @@ def run_daily():
             }
         )
 
-    started = _start_background_job(started_by="schedule", forced=False, forced_profile=None)
+    started, reason = _start_background_job(started_by="schedule", forced=False, forced_profile=None)
     return jsonify(
         {
             "ok": True,
             "started": started,
-            "reason": "started" if started else "already_running_in_process",
+            "reason": reason,
             "now": now.isoformat(timespec="seconds"),
         }
     )
@@ -597,6 +979,7 @@ LOGIN_HTML = """
 </body>
 </html>
 """
+_LOGIN_TPL = app.jinja_env.from_string(LOGIN_HTML)
 
 
 @app.route("/login", methods=["GET", "POST"])
@@ -610,7 +993,7 @@ def login():
             nxt = request.args.get("next") or url_for("admin")
             return redirect(nxt)
         err = "Credenciales inválidas."
-    return render_template_string(LOGIN_HTML, error=err)
+    return _render(_LOGIN_TPL, error=err)
 
 
 @app.get("/logout")
@@ -692,30 +1075,13 @@ ADMIN_HTML = """
 
     <div class="card">
       <h3>Últimos uploads detectados</h3>
-      {% if uploads %}
+      {% if uploads_html %}
         <table>
           <thead>
             <tr><th>Fecha</th><th>Tipo</th><th>ID</th><th>Links</th><th>Estado</th></tr>
           </thead>
           <tbody>
-            {% for u in uploads %}
-            <tr>
-              <td>{{ u.get('ts') }}</td>
-              <td>{{ u.get('kind') }}</td>
-              <td>{{ u.get('id') }}</td>
-              <td>
-                {% if u.get('url_watch') %}<a href="{{ u.get('url_watch') }}" target="_blank">watch</a>{% endif %}
-                {% if u.get('url_shorts') %}&nbsp;|&nbsp;<a href="{{ u.get('url_shorts') }}" target="_blank">shorts</a>{% endif %}
-              </td>
-              <td>
-                {% if u.get('_kind') == 'skipped' %}
-                  SKIPPED ({{ u.get('reason') }})
-                {% else %}
-                  OK
-                {% endif %}
-              </td>
-            </tr>
-            {% endfor %}
+{{ uploads_html|safe }}
           </tbody>
         </table>
       {% else %}
@@ -731,24 +1097,62 @@ ADMIN_HTML = """
 </body>
 </html>
 """
+_ADMIN_TPL = app.jinja_env.from_string(ADMIN_HTML)
+
+
+# filas de uploads pre-renderizadas; se rehacen solo cuando cambian los uploads
+_uploads_html_cache: Dict[str, object] = {"key": None, "html": ""}
+
+
+def _uploads_rows_html(uploads: List[Dict]) -> str:
+    def e(v) -> str:
+        return html.escape(str(v))
+
+    rows = []
+    for u in uploads:
+        links = ""
+        if u.get("url_watch"):
+            links += f'<a href="{e(u["url_watch"])}" target="_blank">watch</a>'
+        if u.get("url_shorts"):
+            links += f'&nbsp;|&nbsp;<a href="{e(u["url_shorts"])}" target="_blank">shorts</a>'
+        estado = f"SKIPPED ({e(u.get('reason'))})" if u.get("_kind") == "skipped" else "OK"
+        rows.append(
+            f"<tr><td>{e(u.get('ts'))}</td><td>{e(u.get('kind'))}</td><td>{e(u.get('id'))}</td>"
+            f"<td>{links}</td><td>{estado}</td></tr>"
+        )
+    return "\n".join(rows)
+
+
+def _uploads_html(uploads: List[Dict]) -> str:
+    # key = el contenido mismo (<= 20 dicts chicos): comparar es mucho más barato que
+    # renderizar, y no depende de un stat() que puede ver otro state.json que el leído
+    if _uploads_html_cache["key"] != uploads:
+        _uploads_html_cache["html"] = _uploads_rows_html(uploads)
+        _uploads_html_cache["key"] = [dict(u) for u in uploads]
+    return _uploads_html_cache["html"]
 
 
 @app.get("/admin")
 @login_required
 def admin():
+    # el HTML depende de state, del tail del log y de latest.json
+    tag, mtime = _etag_for(STATE_FILE, LOG_FILE, LATEST_JSON)
+    if request.if_none_match.contains_weak(tag):
+        return _not_modified(tag, mtime)
     state = _read_state()
     uploads = state.get("uploads") or []
     run_token = os.getenv("RUN_TOKEN", "").strip()
     latest = _read_latest_json()
-    return render_template_string(
-        ADMIN_HTML,
+    html = _render(
+        _ADMIN_TPL,
         state=state,
-        uploads=uploads[:20],
+        uploads_html=_uploads_html(uploads[:20]),
         log_tail=_tail_log(250),
         run_token=run_token,
         latest=latest,
         short_only=SHORT_ONLY,
     )
+    return _with_validators(app.make_response(html), tag, mtime)
 
 
 FUEL_HTML = """
@@ -812,6 +1216,7 @@ FUEL_HTML = """
 </body>
 </html>
 """
+_FUEL_TPL = app.jinja_env.from_string(FUEL_HTML)
 
 
 @app.route("/admin/fuel", methods=["GET", "POST"])
@@ -819,31 +1224,34 @@ FUEL_HTML = """
 def fuel():
     msg = None
     err = None
-    enap = _read_enap() or {}
 
-    if request.method == "POST":
-        g93 = _safe_int(request.form.get("g93", ""))
-        g95 = _safe_int(request.form.get("g95", ""))
-        g97 = _safe_int(request.form.get("g97", ""))
-        diesel = _safe_int(request.form.get("diesel", ""))
-        vig = (request.form.get("vigencia") or "").strip()
-
-        payload = {
-            "vigencia": vig if vig else "",
-            "g93_clp_l": g93,
-            "g95_clp_l": g95,
-            "g97_clp_l": g97,
-            "diesel_clp_l": diesel,
-        }
+    if request.method != "POST":
+        # lectura optimista: _read_enap valida el cache con un solo stat()
+        return _render(_FUEL_TPL, enap=_read_enap() or {}, msg=msg, error=err)
 
-        try:
-            _write_enap(payload)
-            enap = payload
-            msg = "Combustibles actualizados."
-        except Exception as e:
-            err = f"No pude guardar enap_semana.json: {e}"
+    g93 = _safe_int(request.form.get("g93", ""))
+    g95 = _safe_int(request.form.get("g95", ""))
+    g97 = _safe_int(request.form.get("g97", ""))
+    diesel = _safe_int(request.form.get("diesel", ""))
+    vig = (request.form.get("vigencia") or "").strip()
+
+    payload = {
+        "vigencia": vig if vig else "",
+        "g93_clp_l": g93,
+        "g95_clp_l": g95,
+        "g97_clp_l": g97,
+        "diesel_clp_l": diesel,
+    }
 
-    return render_template_string(FUEL_HTML, enap=enap, msg=msg, error=err)
+    try:
+        _write_enap(payload)
+        enap = payload
+        msg = "Combustibles actualizados."
+    except Exception as e:
+        err = f"No pude guardar enap_semana.json: {e}"
+        enap = _read_enap() or {}
+
+    return _render(_FUEL_TPL, enap=enap, msg=msg, error=err)
 
 
 if __name__ == "__main__":
@@ -1,19 +1,20 @@
 import base64
 import datetime as dt
+import hashlib
 import json
 import os
+import struct
 import subprocess
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import TYPE_CHECKING, Optional, Tuple
 
-from google.auth.exceptions import RefreshError
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload
+# el stack de Google (~400 ms de import) se importa dentro de las funciones que
+# lo usan: una corrida sin nada que subir no lo paga
+if TYPE_CHECKING:
+    from googleapiclient.errors import HttpError
 
 BASE = Path(__file__).resolve().parent
 CREDENTIALS_FILE = BASE / "credentials.json"
@@ -30,6 +31,23 @@ SHORTS_MAX_SECONDS = float(os.getenv("YT_SHORTS_MAX_SECONDS", "60"))
 UPLOAD_NORMAL = os.getenv("UPLOAD_NORMAL", "1") == "1"
 UPLOAD_SHORT = os.getenv("UPLOAD_SHORT", "1") == "1"
 
+# whoami() es solo informativo: un GET channels?mine=true menos por corrida si no se pide
+YT_VERBOSE = os.getenv("YT_VERBOSE", "0") == "1"
+
+# subida: single-request hasta este tamaño, resumable con chunks grandes por encima
+SINGLE_REQUEST_MAX_BYTES = int(float(os.getenv("YT_SINGLE_REQUEST_MAX_MB", "32")) * 1024 * 1024)
+UPLOAD_CHUNK_BYTES = 16 * 1024 * 1024
+HTTP_TIMEOUT = int(os.getenv("YT_HTTP_TIMEOUT", "600"))
+
+# access token cacheado entre corridas (dura ~1h); se reusa si le quedan > 5 min
+RUNTIME_DIR = BASE / ".runtime"
+TOKEN_CACHE_MARGIN = dt.timedelta(minutes=5)
+
+_JSON_DECODER = json.JSONDecoder()
+
+_print_lock = threading.Lock()
+_token_cache_file: Optional[Path] = None  # lo fija get_credentials()
+
 DEFAULT_DESCRIPTION = (
     "Resumen diario de dólar, UF, UTM, combustibles, cobre, Brent y cripto.\n"
     "— (Finanzas Hoy Chile)."
@@ -74,7 +92,55 @@ def _date_slash_from_latest() -> str:
     return dt.datetime.now().strftime("%d/%m/%Y")
 
 
-def get_service():
+def _utcnow() -> dt.datetime:
+    # google-auth maneja expiry como datetime UTC naive
+    return dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+
+
+def _token_cache_path(credentials_file: Path, refresh_token: Optional[str]) -> Path:
+    # una entrada por app+cuenta: setups multi-canal no pisan el token del otro
+    key = hashlib.sha256(f"{credentials_file.resolve()}|{refresh_token or ''}".encode("utf-8")).hexdigest()[:16]
+    return RUNTIME_DIR / f"token_cache_{key}.json"
+
+
+def _load_cached_token(creds, cache_file: Path) -> bool:
+    """
+    Si hay un access token cacheado con > 5 min de vida, lo pone en creds y evita el refresh.
+    """
+    try:
+        d = json.loads(cache_file.read_text(encoding="utf-8"))
+        token = d.get("token")
+        expiry = dt.datetime.fromisoformat(d.get("expiry") or "")
+    except Exception:
+        return False
+    if not token or expiry - _utcnow() <= TOKEN_CACHE_MARGIN:
+        return False
+    creds.token = token
+    creds.expiry = expiry
+    return True
+
+
+def _save_cached_token(creds, cache_file: Path) -> None:
+    if not creds.token or not creds.expiry:
+        return
+    try:
+        RUNTIME_DIR.mkdir(exist_ok=True)
+        tmp = cache_file.with_suffix(".tmp")
+        fd = os.open(str(tmp), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"token": creds.token, "expiry": creds.expiry.isoformat()}, f)
+        os.replace(tmp, cache_file)
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar cache de token: {e}")
+
+
+def get_credentials():
+    from google.auth.exceptions import RefreshError
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    global _token_cache_file
     creds = None
 
     credentials_file = CREDENTIALS_FILE
@@ -82,10 +148,9 @@ def get_service():
 
     using_env = _env_b64_present("YT_CREDENTIALS_JSON_B64") and _env_b64_present("YT_TOKEN_JSON_B64")
     if using_env:
-        runtime = BASE / ".runtime"
-        runtime.mkdir(exist_ok=True)
-        credentials_file = runtime / "credentials.json"
-        token_file = runtime / "token.json"
+        RUNTIME_DIR.mkdir(exist_ok=True)
+        credentials_file = RUNTIME_DIR / "credentials.json"
+        token_file = RUNTIME_DIR / "token.json"
         _write_env_b64("YT_CREDENTIALS_JSON_B64", credentials_file)
         _write_env_b64("YT_TOKEN_JSON_B64", token_file)
 
@@ -96,6 +161,13 @@ def get_service():
             print(f"⚠️ No se pudo leer token.json ({e}), pidiendo login nuevo...")
             creds = None
 
+    # token vigente de una corrida anterior: sin round-trip de refresh.
+    # Si igual responde 401, el transport de google-auth refresca solo.
+    if creds is not None and creds.refresh_token:
+        _token_cache_file = _token_cache_path(credentials_file, creds.refresh_token)
+        if not creds.valid and _load_cached_token(creds, _token_cache_file):
+            return creds
+
     headless = (
         bool(os.getenv("RENDER"))
         or bool(os.getenv("RENDER_SERVICE_ID"))
@@ -129,8 +201,46 @@ def get_service():
             creds = flow.run_local_server(port=0)
 
         token_file.write_text(creds.to_json(), encoding="utf-8")
+        _token_cache_file = _token_cache_path(credentials_file, creds.refresh_token)
+        _save_cached_token(creds, _token_cache_file)
+
+    return creds
+
+
+def _refresh_if_expiring(creds) -> None:
+    """
+    Si al token le quedan < 5 min, lo refresca ahora (antes de abrir las subidas)
+    para que ninguna subida lo haga a medio camino ni dos threads a la vez.
+    """
+    if not creds.refresh_token or creds.expiry is None:
+        return
+    if creds.expiry - _utcnow() >= TOKEN_CACHE_MARGIN:
+        return
+
+    from google.auth.transport.requests import Request
+
+    try:
+        creds.refresh(Request())
+        if _token_cache_file is not None:
+            _save_cached_token(creds, _token_cache_file)
+    except Exception as e:
+        # el transport de google-auth vuelve a intentar inline (401/expirado)
+        _say(f"⚠️ Refresh anticipado de token falló: {e}")
 
-    return build("youtube", "v3", credentials=creds, cache_discovery=False)
+
+def _build_service(creds):
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build
+
+    # un Http propio por service: mantiene viva la conexión TLS entre requests
+    # del mismo service (httplib2 no es thread-safe, no se comparte entre threads)
+    http = AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    return build("youtube", "v3", http=http, cache_discovery=False)
+
+
+def get_service():
+    return _build_service(get_credentials())
 
 
 def whoami(youtube):
@@ -143,26 +253,107 @@ def whoami(youtube):
 
 
 def upload_video(youtube, video_path: Path, title: str, description: str, privacy: str = "public") -> Optional[str]:
+    from googleapiclient.http import MediaFileUpload
+
     body = {
         "snippet": {"title": title, "description": description, "categoryId": "22"},
         "status": {"privacyStatus": privacy},
     }
-    media = MediaFileUpload(str(video_path), chunksize=-1, resumable=True)
+    # videos chicos: un solo POST multipart (sin sesión resumable ni loop de chunks).
+    # Ojo: googleapiclient arma ese POST en memoria, por eso el tope.
+    if video_path.stat().st_size <= SINGLE_REQUEST_MAX_BYTES:
+        media = MediaFileUpload(str(video_path), mimetype="video/mp4", resumable=False)
+        response = youtube.videos().insert(part="snippet,status", body=body, media_body=media).execute()
+        return response.get("id")
+
+    media = MediaFileUpload(str(video_path), mimetype="video/mp4", chunksize=UPLOAD_CHUNK_BYTES, resumable=True)
     req = youtube.videos().insert(part="snippet,status", body=body, media_body=media)
 
     response = None
     while response is None:
         status, response = req.next_chunk()
         if status:
-            print(f"⏫ Upload {int(status.progress() * 100)}%")
+            _say(f"⏫ Upload {int(status.progress() * 100)}%")
 
     return response.get("id")
 
 
+def _say(msg: str) -> None:
+    # las subidas corren en threads: una línea por print, sin mezclar marcadores UPLOAD_*
+    with _print_lock:
+        print(msg, flush=True)
+
+
+def _do_upload(creds, kind: str, path: Path, title: str, description: str, privacy: str, youtube=None):
+    """
+    Sube un video con su propio service (httplib2 no es thread-safe).
+    Si viene `youtube`, lo reusa (conexión ya abierta por whoami); nunca en dos threads a la vez.
+    Retorna (kind, video_id, excepción o None): nunca lanza, así main() informa
+    el resultado de la otra subida aunque esta falle (red, timeout, API).
+    """
+    try:
+        if youtube is None:
+            youtube = _build_service(creds)
+        return kind, upload_video(youtube, path, title=title, description=description, privacy=privacy), None
+    except Exception as e:
+        return kind, None, e
+
+
+def _mp4_duration_seconds(path: Path) -> Optional[float]:
+    """
+    Lee la duración desde el box moov/mvhd del MP4 (sin lanzar ffprobe).
+    Salta boxes con seek, así que funciona aunque moov esté al final.
+    """
+    with open(path, "rb") as f:
+        end = os.fstat(f.fileno()).st_size
+        pos = 0
+        while pos + 8 <= end:
+            f.seek(pos)
+            size, kind = struct.unpack(">I4s", f.read(8))
+            hdr = 8
+            if size == 1:
+                size = struct.unpack(">Q", f.read(8))[0]
+                hdr = 16
+            elif size == 0:
+                size = end - pos
+            if size < hdr:
+                return None
+            if kind == b"moov":
+                # moov es contenedor: bajar a sus hijos
+                end = pos + size
+                pos += hdr
+                continue
+            if kind == b"mvhd":
+                version = f.read(4)[0]
+                if version == 1:
+                    timescale, duration = struct.unpack(">16xIQ", f.read(28))
+                else:
+                    timescale, duration = struct.unpack(">8xII", f.read(16))
+                # duración 0 / todo-unos = desconocida (MP4 fragmentado): que decida ffprobe
+                unknown = (1 << (64 if version == 1 else 32)) - 1
+                if not timescale or duration in (0, unknown):
+                    return None
+                return duration / timescale
+            pos += size
+    return None
+
+
 def _ffprobe_duration_seconds(path: Path) -> Optional[float]:
     try:
+        dur = _mp4_duration_seconds(path)
+        if dur is not None:
+            return dur
+    except Exception:
+        pass  # MP4 raro/truncado: que decida ffprobe
+
+    try:
+        # format=duration sale del header (moov): no hace falta analizar streams
         out = subprocess.run(
-            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", str(path)],
+            [
+                "ffprobe", "-v", "error",
+                "-analyzeduration", "0", "-probesize", "64k",
+                "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", str(path),
+            ],
             capture_output=True,
             text=True,
             check=True,
@@ -172,14 +363,18 @@ def _ffprobe_duration_seconds(path: Path) -> Optional[float]:
         return None
 
 
-def _http_error_reason(e: HttpError) -> Tuple[Optional[str], Optional[str]]:
+def _http_error_reason(e: "HttpError") -> Tuple[Optional[str], Optional[str]]:
+    content = getattr(e, "content", None)
+    if not content:
+        return None, None
+    if isinstance(content, bytes):
+        content = content.decode("utf-8", errors="ignore")
+    # el caso que main() distingue: se reconoce aunque el body no sea JSON válido
+    limit = "uploadLimitExceeded" in content
+    if not limit and not content.lstrip().startswith("{"):
+        return None, None  # HTML/texto de un proxy: nada que parsear
     try:
-        content = getattr(e, "content", None)
-        if not content:
-            return None, None
-        if isinstance(content, bytes):
-            content = content.decode("utf-8", errors="ignore")
-        data = json.loads(content)
+        data = _JSON_DECODER.decode(content)
         err = (data or {}).get("error") or {}
         errors = err.get("errors") or []
         if errors:
@@ -188,14 +383,10 @@ def _http_error_reason(e: HttpError) -> Tuple[Optional[str], Optional[str]]:
             return r, m
         return None, err.get("message")
     except Exception:
-        return None, None
+        return ("uploadLimitExceeded", None) if limit else (None, None)
 
 
 def main():
-    youtube = get_service()
-    ch_id, ch_title = whoami(youtube)
-    print(f"👤 Canal autenticado: {ch_title} ({ch_id})")
-
     video = BASE / "out" / "finanzas_hoy.mp4"
     short_video = BASE / "out" / "finanzas_hoy_short.mp4"
 
@@ -211,41 +402,73 @@ def main():
     description = os.getenv("YT_DESCRIPTION", DEFAULT_DESCRIPTION)
     privacy = os.getenv("YT_PRIVACY", "public")
 
-    try:
-        if UPLOAD_NORMAL:
-            if not video.exists():
-                print(f"❌ No existe el video normal: {video}")
-            else:
-                vid = upload_video(youtube, video, title=title, description=description, privacy=privacy)
-                print(f"✅ Video subido. ID: {vid} | privacidad: {privacy}")
-                if vid:
-                    print(f"UPLOAD_RESULT kind=normal id={vid} privacy={privacy}")
-
-        if UPLOAD_SHORT:
-            if not short_video.exists():
-                print(f"❌ No existe el short: {short_video}")
+    jobs = []  # (kind, path, title)
+
+    if UPLOAD_NORMAL:
+        if not video.exists():
+            print(f"❌ No existe el video normal: {video}")
+        else:
+            jobs.append(("normal", video, title))
+
+    if UPLOAD_SHORT:
+        if not short_video.exists():
+            print(f"❌ No existe el short: {short_video}")
+        else:
+            dur = _ffprobe_duration_seconds(short_video)
+            if dur is None:
+                print("⚠️ No pude leer duración del short con ffprobe. No lo subo por seguridad.")
+            elif dur > SHORTS_MAX_SECONDS:
+                print(f"⚠️ Short NO subido: dura {dur:.1f}s y el máximo es {SHORTS_MAX_SECONDS:.0f}s.")
             else:
-                dur = _ffprobe_duration_seconds(short_video)
-                if dur is None:
-                    print("⚠️ No pude leer duración del short con ffprobe. No lo subo por seguridad.")
-                elif dur > SHORTS_MAX_SECONDS:
-                    print(f"⚠️ Short NO subido: dura {dur:.1f}s y el máximo es {SHORTS_MAX_SECONDS:.0f}s.")
+                jobs.append(("short", short_video, short_title))
+
+    if not jobs:
+        return
+
+    creds = get_credentials()
+    _refresh_if_expiring(creds)
+    youtube = _build_service(creds)
+    if YT_VERBOSE:
+        ch_id, ch_title = whoami(youtube)
+        print(f"👤 Canal autenticado: {ch_title} ({ch_id})")
+
+    from googleapiclient.errors import HttpError
+
+    # normal + short en paralelo: ambas subidas son I/O de red independiente
+    fatal: Optional[Exception] = None
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        # la primera subida hereda el service del hilo principal (si whoami corrió,
+        # misma conexión TLS); el hilo principal ya no lo usa desde aquí
+        futures = [
+            pool.submit(_do_upload, creds, kind, path, t, description, privacy, youtube if i == 0 else None)
+            for i, (kind, path, t) in enumerate(jobs)
+        ]
+        for fut in as_completed(futures):
+            kind, vid, err = fut.result()
+
+            if err is not None:
+                reason, msg = _http_error_reason(err)
+                if reason == "uploadLimitExceeded":
+                    _say("⚠️ YouTube bloqueó la subida por límite temporal del canal/cuenta (uploadLimitExceeded).")
+                    if msg:
+                        _say(f"ℹ️ Detalle: {msg}")
+                    _say(f"UPLOAD_SKIPPED kind={kind} reason=uploadLimitExceeded")
+                    continue
+                if isinstance(err, HttpError):
+                    _say(f"❌ Error YouTube API ({kind}): {err}")
                 else:
-                    vid_s = upload_video(youtube, short_video, title=short_title, description=description, privacy=privacy)
-                    print(f"✅ Short subido. ID: {vid_s} | privacidad: {privacy}")
-                    if vid_s:
-                        print(f"UPLOAD_RESULT kind=short id={vid_s} privacy={privacy}")
-
-    except HttpError as e:
-        reason, msg = _http_error_reason(e)
-        if reason == "uploadLimitExceeded":
-            print("⚠️ YouTube bloqueó la subida por límite temporal del canal/cuenta (uploadLimitExceeded).")
-            if msg:
-                print(f"ℹ️ Detalle: {msg}")
-            print("UPLOAD_SKIPPED kind=short reason=uploadLimitExceeded")
-            return
-        print(f"❌ Error YouTube API: {e}")
-        raise
+                    _say(f"❌ Error subiendo {kind}: {type(err).__name__}: {err}")
+                # se relanza recién al final: antes se imprimen todos los UPLOAD_RESULT
+                fatal = fatal or err
+                continue
+
+            label = "Video" if kind == "normal" else "Short"
+            _say(f"✅ {label} subido. ID: {vid} | privacidad: {privacy}")
+            if vid:
+                _say(f"UPLOAD_RESULT kind={kind} id={vid} privacy={privacy}")
+
+    if fatal is not None:
+        raise fatal
 
 
 if __name__ == "__main__":
@@ -18,15 +18,31 @@ CAMBIO CLAVE:
   - out/locucion_short.m4a (short, guion corto)
 """
 
+import asyncio
+import atexit
+import functools
+import hashlib
 import json
+import math
 import os
+import platform
 import re
+import select
 import shutil
 import subprocess
 import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, Optional
 
+try:
+    import orjson  # opcional: JSON en C, más rápido
+except ImportError:
+    orjson = None
+
 # ===== Paths =====
 LATEST_JSON = Path(os.getenv("LATEST_JSON_PATH", "data/latest.json"))
 LAST_OK_JSON = Path(os.getenv("LAST_OK_JSON_PATH", "data/last_ok.json"))
@@ -47,10 +63,18 @@ EDGE_VOICE = os.getenv("EDGE_VOICE", "es-CL-CatalinaNeural").strip()
 EDGE_RATE = os.getenv("EDGE_RATE", "0").strip()   # puede venir "5" o "+5%"
 EDGE_PITCH = os.getenv("EDGE_PITCH", "0").strip() # puede venir "0" o "+0Hz"
 EDGE_VOLUME = os.getenv("EDGE_VOLUME", "").strip()  # opcional: "+0%"
+# Opt-in: Edge entrega mp3 y make_video.sh recodifica el audio a AAC igual, así que se
+# puede saltar la recodificación aquí. Con EDGE_SKIP_REMUX=1: .mp3 de salida => bytes tal
+# cual; .m4a => mp3 copiado dentro del contenedor mp4 (ya no AAC). Por defecto: AAC como siempre.
+EDGE_SKIP_REMUX = os.getenv("EDGE_SKIP_REMUX", "0").strip() == "1"
 
 # ===== macOS say =====
 PREFERRED_ES_VOICES = ["Paulina", "Mónica", "Jorge", "Diego", "Juan"]
 FALLBACK_VOICE = os.getenv("VOICE_NAME", "Paulina").strip()
+# primer token de cada línea de `say -v ?` que mencione es_/Spanish (una pasada sobre todo el texto)
+_ES_VOICE_RE = re.compile(r"^(?=.*(?:es_|Spanish))[ \t]*(\S+)", re.M)
+# voz elegida persistida entre corridas (se invalida si cambia la versión de macOS)
+VOICE_PICK_CACHE = Path(os.getenv("VOICE_PICK_CACHE", "~/.cache/finanzaschile/voice.txt")).expanduser()
 
 # ===== Piper (Linux/Render) =====
 USE_PIPER = os.getenv("USE_PIPER", "1").strip() == "1"
@@ -64,6 +88,11 @@ PIPER_SENTENCE_SILENCE = os.getenv("PIPER_SENTENCE_SILENCE", "0.20").strip()
 PIPER_NOISE_SCALE = os.getenv("PIPER_NOISE_SCALE", "").strip()
 PIPER_NOISE_W = os.getenv("PIPER_NOISE_W", "").strip()
 
+_PIPER_VOICE = None  # PiperVoice cargado una vez por proceso
+# piper --json-input: espera máxima por pedido = base + por carácter (piper colgado => proceso único)
+PIPER_DAEMON_TIMEOUT = float(os.getenv("PIPER_DAEMON_TIMEOUT", "30"))
+PIPER_DAEMON_SECS_PER_CHAR = 0.05
+
 # ===== espeak fallback =====
 ESPEAK_VOICE = os.getenv("ESPEAK_VOICE", "es+f3").strip()
 ESPEAK_PITCH = os.getenv("ESPEAK_PITCH", "55").strip()
@@ -73,6 +102,77 @@ ESPEAK_GAP = os.getenv("ESPEAK_GAP", "6").strip()
 # ffmpeg
 AUDIO_BITRATE = os.getenv("VOICE_AAC_BITRATE", "128k").strip()
 
+# ===== síntesis por oración en paralelo (Edge/espeak) =====
+# workers; 0/1 = una sola llamada al motor con el guion completo
+VOICE_PARALLEL = int(os.getenv("VOICE_PARALLEL", "0") or 0)
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+
+# ===== cache de audio (mismo motor+voz+texto => mismo m4a) =====
+VOICE_CACHE_DIR = Path(os.getenv("VOICE_CACHE_DIR", "out/.tts_cache"))
+VOICE_CACHE_MB = float(os.getenv("VOICE_CACHE_MB", "50"))  # 0 = sin cache
+
+
+# Con argv[0] absoluto (lo resuelve _caps) y close_fds=False, CPython lanza el hijo con
+# posix_spawn en vez de fork+exec. Es seguro: todo fd que abre Python es no-heredable
+# (PEP 446); solo pasan los que Popen conecta a stdin/stdout/stderr.
+_SPAWN_KW = {"close_fds": False}
+
+
+@dataclass(frozen=True)
+class _Caps:
+    """
+    Binarios/motores disponibles, resueltos una vez por proceso.
+    """
+    edge_bin: Optional[str]
+    piper_bin: Optional[str]
+    espeak: Optional[str]
+    ffmpeg: str
+    say: bool
+    afconvert: Optional[str]
+
+
+@functools.lru_cache(maxsize=1)
+def _caps() -> _Caps:
+    # lazy (no al importar): importar el módulo no recorre el PATH
+    return _Caps(
+        edge_bin=shutil.which(EDGE_TTS_BIN) if USE_EDGE_TTS else None,
+        piper_bin=shutil.which(PIPER_BIN) if USE_PIPER else None,
+        espeak=shutil.which("espeak-ng") or shutil.which("espeak"),
+        ffmpeg=shutil.which("ffmpeg") or "ffmpeg",
+        say=sys.platform == "darwin" and Path("/usr/bin/say").exists(),
+        afconvert=shutil.which("afconvert") if sys.platform == "darwin" else None,
+    )
+
+
+def _run_quiet(cmd, input_text: Optional[str] = None) -> None:
+    """
+    subprocess.run sin ruido: stdout a /dev/null, stderr capturado y
+    solo se imprime (cola) si el comando falla.
+    """
+    try:
+        subprocess.run(
+            cmd,
+            input=input_text.encode("utf-8") if input_text is not None else None,
+            stdin=subprocess.DEVNULL if input_text is None else None,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            check=True,
+            **_SPAWN_KW,
+        )
+    except subprocess.CalledProcessError as e:
+        err = (e.stderr or b"").decode("utf-8", errors="replace").strip()
+        if err:
+            print(f"CMD_FAILED {Path(str(cmd[0])).name} rc={e.returncode}\n{err[-2000:]}")
+        raise
+
+
+def _read_json(path: Path):
+    # bytes directo al parser: sin decodificar a str primero
+    raw = path.read_bytes()
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
 
 # -------------------------
 # Helpers fallback data
@@ -88,48 +188,63 @@ def _load_last_ok_anyhow() -> Dict:
 
     try:
         if LAST_OK_JSON.exists():
-            return json.loads(LAST_OK_JSON.read_text(encoding="utf-8"))
+            return _read_json(LAST_OK_JSON)
     except Exception:
         pass
 
     return {}
 
 
+# claves que leen build_text_full/short (las únicas que vale la pena completar)
+_TEXT_KEYS = (
+    "fecha", "fecha_slash",
+    "dolar_clp", "uf_clp", "utm_clp",
+    "btc_usd", "eth_usd", "cobre_usd_lb", "brent_usd",
+    "g93_clp_l", "g95_clp_l", "g97_clp_l", "diesel_clp_l",
+)
+
+
+def _is_complete(latest: Dict) -> bool:
+    return bool(latest) and all(latest.get(k) is not None for k in _TEXT_KEYS)
+
+
 def _merge_with_fallback(latest: Dict, last_ok: Dict) -> Dict:
+    if _is_complete(latest):
+        return latest
     out = dict(latest or {})
-    for k, v in (last_ok or {}).items():
-        if out.get(k) is None and v is not None:
-            out[k] = v
+    last_ok = last_ok or {}
+    for k in _TEXT_KEYS:
+        if out.get(k) is None and last_ok.get(k) is not None:
+            out[k] = last_ok[k]
     return out
 
 
 # -------------------------
-# Texto: limpieza + números
+# Texto: números
 # -------------------------
-def _clean_spaces(s: str) -> str:
-    s = (s or "").strip()
-    # respeta saltos de línea simples (mejor para TTS), pero evita basura
-    s = re.sub(r"[ \t]+", " ", s)
-    s = re.sub(r"\n{3,}", "\n\n", s)
-    return s.strip()
-
-
-def _to_int_like(x) -> Optional[int]:
-    try:
-        if x is None:
+def _to_float(x) -> Optional[float]:
+    # latest.json trae números: el caso normal no pasa por try/except
+    if x is None:
+        return None
+    if isinstance(x, (int, float)):
+        return float(x)
+    if isinstance(x, str):
+        x = x.strip()
+        if not x:
             return None
-        return int(round(float(x)))
-    except Exception:
+    try:
+        return float(x)
+    except (TypeError, ValueError):
         return None
 
 
-def _to_float(x) -> Optional[float]:
-    try:
-        if x is None:
-            return None
-        return float(x)
-    except Exception:
+def _to_int_like(x) -> Optional[int]:
+    if type(x) is int:  # bool queda fuera: True -> 1 como antes
+        return x
+    f = x if type(x) is float else _to_float(x)
+    if f is None or not math.isfinite(f):
         return None
+    return int(round(f))
 
 
 def _si(x, nd="no disponible"):
@@ -176,7 +291,8 @@ def build_text_full(data: dict) -> str:
         f"Ethereum: {_si(eth)} dólares.",
         "— Finanzas Hoy Chile.",
     ]
-    return _clean_spaces("\n".join(parts))
+    # una oración por línea y sin espacios repetidos por construcción: no hace falta limpiar
+    return "\n".join(parts)
 
 
 def build_text_short(data: dict) -> str:
@@ -196,7 +312,7 @@ def build_text_short(data: dict) -> str:
         f"Bitcoin: {_si(btc)} dólares.",
         "— Finanzas Hoy Chile.",
     ]
-    return _clean_spaces("\n".join([p for p in parts if p]))
+    return "\n".join([p for p in parts if p])
 
 
 # -------------------------
@@ -230,52 +346,119 @@ def _edge_pitch_str(v: str) -> str:
         return "+0Hz"
 
 
-def _have_edge_tts() -> bool:
+@functools.lru_cache(maxsize=1)
+def _edge_tts_mod():
+    # edge-tts como librería: sin levantar otro intérprete Python por locución.
+    # Import perezoso (arrastra aiohttp): solo se paga con USE_EDGE_TTS=1
     if not USE_EDGE_TTS:
-        return False
-    return shutil.which(EDGE_TTS_BIN) is not None
+        return None
+    try:
+        import edge_tts  # type: ignore
+        return edge_tts
+    except Exception:
+        return None
 
 
-def _edge_tts_to_m4a(text: str, out_m4a: Path) -> None:
-    """
-    Usa CLI edge-tts para generar mp3 + vtt y luego convierte a m4a (aac).
-    """
-    out_m4a.parent.mkdir(parents=True, exist_ok=True)
+def _have_edge_tts() -> bool:
+    if not USE_EDGE_TTS:
+        return False
+    return _edge_tts_mod() is not None or _caps().edge_bin is not None
 
-    mp3 = out_m4a.with_name(out_m4a.stem + "_edge.mp3")
-    vtt = out_m4a.with_name(out_m4a.stem + "_edge.vtt")
-
-    rate = _edge_rate_str(EDGE_RATE)
-    pitch = _edge_pitch_str(EDGE_PITCH)
 
+def _edge_cli_cmd(text: str, rate: str, pitch: str):
+    # sin --write-media edge-tts escribe el audio en stdout; los subtítulos (no se usan)
+    # irían a stderr, así que se mandan a /dev/null
     cmd = [
-        EDGE_TTS_BIN,
+        _caps().edge_bin or EDGE_TTS_BIN,
         "--voice", EDGE_VOICE,
         "--rate", rate,
         "--pitch", pitch,
         "--text", text,
-        "--write-media", str(mp3),
-        "--write-subtitles", str(vtt),
+        "--write-subtitles", os.devnull,
     ]
     if EDGE_VOLUME:
         cmd += ["--volume", EDGE_VOLUME]
+    return cmd
+
+
+def _edge_py_stream(text: str, sink, rate: str, pitch: str) -> None:
+    async def _stream():
+        kwargs = {"rate": rate, "pitch": pitch}
+        if EDGE_VOLUME:
+            kwargs["volume"] = EDGE_VOLUME
+        comm = _edge_tts_mod().Communicate(text, EDGE_VOICE, **kwargs)
+        # los chunks mp3 van al archivo/ffmpeg a medida que llegan por el websocket
+        async for chunk in comm.stream():
+            if chunk["type"] == "audio":
+                sink.write(chunk["data"])
+
+    asyncio.run(_stream())
 
-    subprocess.run(cmd, check=True)
 
-    subprocess.run(
-        ["ffmpeg", "-y", "-i", str(mp3), "-c:a", "aac", "-b:a", AUDIO_BITRATE, str(out_m4a)],
-        check=True,
+def _edge_py_to_m4a(text: str, out_m4a: Path, rate: str, pitch: str) -> None:
+    ff = subprocess.Popen(
+        _ffmpeg_aac_cmd(["-f", "mp3", "-i", "pipe:0"], out_m4a, copy_audio=EDGE_SKIP_REMUX),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        **_SPAWN_KW,
     )
+    try:
+        _edge_py_stream(text, ff.stdin, rate, pitch)
+    finally:
+        ff.stdin.close()
+        rc = ff.wait()
+    if rc:
+        raise subprocess.CalledProcessError(rc, "ffmpeg")
+
+
+def _edge_tts_to_mp3(text: str, mp3: Path) -> None:
+    """
+    mp3 tal cual lo entrega Edge, sin ffmpeg (salida .mp3 o partes por oración).
+    """
+    rate = _edge_rate_str(EDGE_RATE)
+    pitch = _edge_pitch_str(EDGE_PITCH)
+
+    if _edge_tts_mod() is not None:
+        try:
+            with open(mp3, "wb") as f:
+                _edge_py_stream(text, f, rate, pitch)
+            return
+        except Exception as e:
+            if _caps().edge_bin is None:
+                raise
+            print(f"EDGE_PY_FAILED error={e} (uso CLI)")
+
+    _run_quiet(_edge_cli_cmd(text, rate, pitch) + ["--write-media", str(mp3)])
+
 
-    mp3.unlink(missing_ok=True)
-    vtt.unlink(missing_ok=True)
+def _edge_tts_to_m4a(text: str, out_m4a: Path) -> None:
+    """
+    edge-tts (librería o CLI) con el mp3 directo a ffmpeg: sin mp3/vtt temporales,
+    y ffmpeg avanza mientras llega el audio. Con EDGE_SKIP_REMUX el mp3 no se recodifica.
+    """
+    if EDGE_SKIP_REMUX and out_m4a.suffix.lower() == ".mp3":
+        _edge_tts_to_mp3(text, out_m4a)
+        return
+
+    rate = _edge_rate_str(EDGE_RATE)
+    pitch = _edge_pitch_str(EDGE_PITCH)
+
+    if _edge_tts_mod() is not None:
+        try:
+            _edge_py_to_m4a(text, out_m4a, rate, pitch)
+            return
+        except Exception as e:
+            if _caps().edge_bin is None:
+                raise
+            print(f"EDGE_PY_FAILED error={e} (uso CLI)")
 
-    print(f"TTS_ENGINE=edge_tts voice={EDGE_VOICE} rate={rate} pitch={pitch}")
+    _tts_pipe_to_m4a(_edge_cli_cmd(text, rate, pitch), ["-f", "mp3"], out_m4a, copy_audio=EDGE_SKIP_REMUX)
 
 
 # -------------------------
 # macOS say
 # -------------------------
+@functools.lru_cache(maxsize=1)
 def _list_system_voices() -> str:
     try:
         return subprocess.run(
@@ -288,44 +471,200 @@ def _list_system_voices() -> str:
         return ""
 
 
+@functools.lru_cache(maxsize=1)
 def _pick_spanish_voice() -> str:
-    out = _list_system_voices()
-    candidates = []
-    for line in (out or "").splitlines():
-        if "es_" in line or "Spanish" in line:
-            name = line.split(None, 1)[0].strip()
-            candidates.append(name)
+    mac_ver = platform.mac_ver()[0]
+    try:
+        cached_ver, cached_voice = VOICE_PICK_CACHE.read_text(encoding="utf-8").split("\n")[:2]
+        if cached_ver == mac_ver and cached_voice:
+            return cached_voice
+    except Exception:
+        pass
+
+    voice = _pick_installed_spanish_voice()
+    if not voice:
+        return FALLBACK_VOICE or ""
+    try:
+        VOICE_PICK_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        VOICE_PICK_CACHE.write_text(f"{mac_ver}\n{voice}\n", encoding="utf-8")
+    except Exception:
+        pass
+    return voice
+
+
+def _pick_installed_spanish_voice() -> str:
+    candidates = _ES_VOICE_RE.findall(_list_system_voices() or "")
+
+    # lowercase una vez por nombre, no N×M veces dentro del loop
+    candidates_lc = [c.lower() for c in candidates]
+    for pref in [p.lower() for p in PREFERRED_ES_VOICES]:
+        for i, cand in enumerate(candidates_lc):
+            if cand.startswith(pref):
+                return candidates[i]
+
+    return candidates[0] if candidates else ""
 
-    for pref in PREFERRED_ES_VOICES:
-        for cand in candidates:
-            if cand.lower().startswith(pref.lower()):
-                return cand
 
-    return candidates[0] if candidates else (FALLBACK_VOICE or "")
+def _bitrate_bps() -> Optional[int]:
+    # VOICE_AAC_BITRATE viene en formato ffmpeg ("128k")
+    v = AUDIO_BITRATE.lower()
+    try:
+        return int(float(v[:-1]) * 1000) if v.endswith("k") else int(v)
+    except ValueError:
+        return None
+
+
+def _say_bitrate_args():
+    bps = _bitrate_bps()
+    return [f"--bit-rate={bps}"] if bps else []
+
+
+def _afconvert_bitrate_args():
+    bps = _bitrate_bps()
+    return ["-b", str(bps)] if bps else []
 
 
 # -------------------------
 # Piper
 # -------------------------
+@functools.lru_cache(maxsize=1)
+def _piper_voice_cls():
+    # piper-tts como librería: el modelo queda cargado entre FULL y SHORT.
+    # Import perezoso (carga onnxruntime): solo si de verdad se va a usar Piper
+    if not USE_PIPER:
+        return None
+    try:
+        from piper import PiperVoice  # type: ignore
+        return PiperVoice
+    except Exception:
+        return None
+
+
+@functools.lru_cache(maxsize=1)
 def _have_piper() -> bool:
+    # la config sale de env leída al importar: basta con evaluarlo una vez
+    reason = None
     if not USE_PIPER:
-        return False
-    if shutil.which(PIPER_BIN) is None:
-        return False
-    if not PIPER_MODEL:
-        return False
-    if not Path(PIPER_MODEL).exists():
+        reason = "USE_PIPER=0"
+    elif not PIPER_MODEL:
+        reason = "PIPER_MODEL vacío"
+    elif not Path(PIPER_MODEL).exists():
+        reason = f"no existe {PIPER_MODEL}"
+    elif _piper_voice_cls() is None and _caps().piper_bin is None:
+        reason = f"sin binario {PIPER_BIN} ni módulo piper"
+
+    if reason:
+        print(f"PIPER_SKIPPED reason={reason}")
         return False
     return True
 
 
-def _piper_to_wav(text: str, wav_path: Path) -> None:
-    wav_path.parent.mkdir(parents=True, exist_ok=True)
+def _piper_voice():
+    global _PIPER_VOICE
+    if _PIPER_VOICE is None:
+        config = PIPER_CONFIG if PIPER_CONFIG and Path(PIPER_CONFIG).exists() else None
+        _PIPER_VOICE = _piper_voice_cls().load(PIPER_MODEL, config_path=config, use_cuda=False)
+    return _PIPER_VOICE
+
+
+def _piper_sample_rate() -> Optional[int]:
+    # --output_raw no trae header: el sample rate sale del .onnx.json del modelo
+    cfg = Path(PIPER_CONFIG) if PIPER_CONFIG else Path(PIPER_MODEL + ".json")
+    try:
+        return int(_read_json(cfg)["audio"]["sample_rate"])
+    except Exception:
+        return None
+
+
+def _ffmpeg_aac_cmd(input_args, out_m4a: Path, copy_audio: bool = False):
+    # -loglevel error: sin banner ni stats por frame en el log del pipeline
+    # copy a .m4a: -f mp4 porque el muxer por defecto (ipod) no acepta mp3
+    if copy_audio:
+        codec = ["-c:a", "copy"] + ([] if out_m4a.suffix.lower() == ".mp3" else ["-f", "mp4"])
+    else:
+        codec = ["-c:a", "aac", "-b:a", AUDIO_BITRATE]
+    return [_caps().ffmpeg, "-y", "-hide_banner", "-loglevel", "error", *input_args, *codec, str(out_m4a)]
+
 
+def _tts_pipe_to_m4a(
+    tts_cmd,
+    input_args,
+    out_m4a: Path,
+    stdin_text: Optional[str] = None,
+    copy_audio: bool = False,
+) -> None:
+    """
+    TTS -> stdout -> ffmpeg stdin -> m4a. Sin WAV intermedio y ffmpeg
+    codifica mientras el TTS todavía está generando.
+    """
+    tts = subprocess.Popen(
+        tts_cmd,
+        stdin=subprocess.PIPE if stdin_text is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        **_SPAWN_KW,
+    )
+    try:
+        ff = subprocess.Popen(
+            _ffmpeg_aac_cmd([*input_args, "-i", "pipe:0"], out_m4a, copy_audio=copy_audio),
+            stdin=tts.stdout,
+            stdout=subprocess.DEVNULL,
+            **_SPAWN_KW,
+        )
+    except Exception:
+        tts.kill()
+        tts.wait()
+        raise
+    # ffmpeg queda como único lector: si se cae, el TTS recibe SIGPIPE y no se cuelga
+    tts.stdout.close()
+
+    if stdin_text is not None:
+        try:
+            tts.stdin.write(stdin_text.encode("utf-8"))
+            tts.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    tts_rc = tts.wait()
+    ff_rc = ff.wait()
+    if tts_rc:
+        raise subprocess.CalledProcessError(tts_rc, tts_cmd)
+    if ff_rc:
+        raise subprocess.CalledProcessError(ff_rc, "ffmpeg")
+
+
+def _piper_py_to_m4a(text: str, out_m4a: Path) -> None:
+    kwargs = {
+        "length_scale": float(PIPER_LENGTH_SCALE),
+        "sentence_silence": float(PIPER_SENTENCE_SILENCE),
+    }
+    if PIPER_NOISE_SCALE:
+        kwargs["noise_scale"] = float(PIPER_NOISE_SCALE)
+    if PIPER_NOISE_W:
+        kwargs["noise_w"] = float(PIPER_NOISE_W)
+
+    voice = _piper_voice()
+    raw_in = ["-f", "s16le", "-ar", str(voice.config.sample_rate), "-ac", "1"]
+    ff = subprocess.Popen(
+        _ffmpeg_aac_cmd([*raw_in, "-i", "pipe:0"], out_m4a),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        **_SPAWN_KW,
+    )
+    try:
+        # PCM por oración directo al encoder
+        for chunk in voice.synthesize_stream_raw(text, **kwargs):
+            ff.stdin.write(chunk)
+    finally:
+        ff.stdin.close()
+        rc = ff.wait()
+    if rc:
+        raise subprocess.CalledProcessError(rc, "ffmpeg")
+
+
+def _piper_cmd():
     cmd = [
-        PIPER_BIN,
+        _caps().piper_bin or PIPER_BIN,
         "--model", PIPER_MODEL,
-        "--output_file", str(wav_path),
         "--length_scale", str(PIPER_LENGTH_SCALE),
         "--sentence_silence", str(PIPER_SENTENCE_SILENCE),
     ]
@@ -336,93 +675,343 @@ def _piper_to_wav(text: str, wav_path: Path) -> None:
         cmd += ["--noise_scale", str(PIPER_NOISE_SCALE)]
     if PIPER_NOISE_W:
         cmd += ["--noise_w", str(PIPER_NOISE_W)]
+    return cmd
 
-    subprocess.run(cmd, input=text, text=True, check=True)
+
+class _PiperDaemon:
+    """
+    Proceso piper vivo entre llamadas (--json-input): el modelo ONNX se carga
+    una sola vez por proceso. Cada línea JSON de stdin genera un WAV y piper
+    responde con su path en stdout.
+    """
+
+    def __init__(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="piper_")
+        self.lock = threading.Lock()  # un pedido a la vez: stdin/stdout van en pareja
+        self.proc = subprocess.Popen(
+            _piper_cmd() + ["--json-input", "--output_dir", self.tmpdir],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+            **_SPAWN_KW,
+        )
+
+    def synth(self, text: str, wav_path: Path) -> None:
+        with self.lock:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"piper terminó (rc={self.proc.returncode})")
+            req = json.dumps({"text": text, "output_file": str(wav_path.resolve())}, ensure_ascii=False)
+            self.proc.stdin.write(req + "\n")
+            self.proc.stdin.flush()
+
+            # readline() sin plazo colgaría el paso (y el lock del pipeline) si piper se traba
+            timeout = PIPER_DAEMON_TIMEOUT + PIPER_DAEMON_SECS_PER_CHAR * len(text)
+            ready, _, _ = select.select([self.proc.stdout], [], [], timeout)
+            if not ready:
+                self.proc.kill()
+                raise RuntimeError(f"piper no respondió en {timeout:.0f}s")
+            if not self.proc.stdout.readline():
+                raise RuntimeError("piper cerró stdout sin generar audio")
+            if not wav_path.exists() or wav_path.stat().st_size == 0:
+                raise RuntimeError(f"piper respondió pero no escribió {wav_path}")
+
+    def close(self) -> None:
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except Exception:
+            self.proc.kill()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+_PIPER_DAEMON: Optional[_PiperDaemon] = None
+
+
+def _piper_daemon() -> _PiperDaemon:
+    global _PIPER_DAEMON
+    if _PIPER_DAEMON is None:
+        _PIPER_DAEMON = _PiperDaemon()
+        atexit.register(_close_piper_daemon)
+    return _PIPER_DAEMON
+
+
+def _close_piper_daemon() -> None:
+    global _PIPER_DAEMON
+    if _PIPER_DAEMON is not None:
+        _PIPER_DAEMON.close()
+        _PIPER_DAEMON = None
+
+
+def _piper_to_m4a(text: str, out_m4a: Path) -> None:
+    if _piper_voice_cls() is not None:
+        try:
+            _piper_py_to_m4a(text, out_m4a)
+            return
+        except Exception as e:
+            # API distinta (piper-tts >= 1.3) o modelo que no carga: binario
+            if _caps().piper_bin is None:
+                raise
+            print(f"PIPER_PY_FAILED error={e} (uso binario)")
+
+    wav = out_m4a.with_suffix(".wav")
+    wav.unlink(missing_ok=True)  # que un WAV viejo no pase por respuesta del daemon
+    try:
+        _piper_daemon().synth(text, wav)
+        _wav_to_m4a(wav, out_m4a)
+        return
+    except Exception as e:
+        print(f"PIPER_DAEMON_FAILED error={e} (uso proceso único)")
+        _close_piper_daemon()
+    finally:
+        wav.unlink(missing_ok=True)
+
+    cmd = _piper_cmd()
+    sample_rate = _piper_sample_rate()
+    if sample_rate is None:
+        # sin config legible no sabemos el formato raw: vía WAV temporal
+        _run_quiet(cmd + ["--output_file", str(wav)], input_text=text)
+        _wav_to_m4a(wav, out_m4a)
+        wav.unlink(missing_ok=True)
+        return
+
+    _tts_pipe_to_m4a(
+        cmd + ["--output_raw"],
+        ["-f", "s16le", "-ar", str(sample_rate), "-ac", "1"],
+        out_m4a,
+        stdin_text=text,
+    )
 
 
 # -------------------------
 # espeak fallback
 # -------------------------
-def _espeak_to_wav(text: str, wav_path: Path, rate: int) -> None:
-    wav_path.parent.mkdir(parents=True, exist_ok=True)
-
-    tts_bin = shutil.which("espeak-ng") or shutil.which("espeak")
+def _espeak_cmd(text: str, rate: int, output_args):
+    tts_bin = _caps().espeak
     if not tts_bin:
         raise RuntimeError("No se encontró espeak-ng ni espeak en el sistema.")
 
-    cmd = [
+    return [
         tts_bin,
         "-v", ESPEAK_VOICE or "es",
         "-s", str(rate),
         "-p", ESPEAK_PITCH,
         "-a", ESPEAK_AMP,
         "-g", ESPEAK_GAP,
-        "-w", str(wav_path),
+        *output_args,
         text,
     ]
-    subprocess.run(cmd, check=True)
+
+
+def _espeak_to_m4a(text: str, out_m4a: Path, rate: int) -> None:
+    _tts_pipe_to_m4a(_espeak_cmd(text, rate, ["--stdout"]), ["-f", "wav"], out_m4a)
+
+
+def _espeak_to_wav(text: str, wav: Path, rate: int) -> None:
+    # partes por oración: WAV crudo, el único ffmpeg lo hace _synth_parts
+    _run_quiet(_espeak_cmd(text, rate, ["-w", str(wav)]))
 
 
 # -------------------------
 # WAV -> M4A
 # -------------------------
 def _wav_to_m4a(wav: Path, out_m4a: Path) -> None:
-    out_m4a.parent.mkdir(parents=True, exist_ok=True)
-    subprocess.run(
-        ["ffmpeg", "-y", "-i", str(wav), "-c:a", "aac", "-b:a", AUDIO_BITRATE, str(out_m4a)],
-        check=True,
-    )
+    _run_quiet(_ffmpeg_aac_cmd(["-i", str(wav)], out_m4a))
+
+
+# -------------------------
+# Cache de audio
+# -------------------------
+def _engine_plan(rate: int):
+    """
+    Motor que speak() va a intentar primero + todo lo que cambia su salida.
+    """
+    # por oración el audio cambia (pausas entre partes): va en la key
+    split = "split" if VOICE_PARALLEL > 1 else "whole"
+    if _have_edge_tts():
+        return (
+            "edge_tts", EDGE_VOICE, _edge_rate_str(EDGE_RATE), _edge_pitch_str(EDGE_PITCH), EDGE_VOLUME,
+            split, "mp3" if EDGE_SKIP_REMUX else "aac",
+        )
+    if _caps().say:
+        return ("macos_say", _pick_spanish_voice(), str(rate))
+    if _have_piper():
+        return (
+            "piper", PIPER_MODEL, PIPER_CONFIG, PIPER_LENGTH_SCALE,
+            PIPER_SENTENCE_SILENCE, PIPER_NOISE_SCALE, PIPER_NOISE_W,
+        )
+    return ("espeak", ESPEAK_VOICE, str(rate), ESPEAK_PITCH, ESPEAK_AMP, ESPEAK_GAP, split)
+
+
+def _cache_key(plan, suffix: str, text: str) -> str:
+    # el contenedor va en la key: con EDGE_SKIP_REMUX un .mp3 son bytes mp3 crudos,
+    # que no sirven para hardlinkear a un .m4a (ni al revés)
+    return hashlib.sha256("|".join([*plan, suffix, AUDIO_BITRATE, text]).encode("utf-8")).hexdigest()
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    # hardlink a un temporal + replace: dst nunca queda a medias
+    tmp = dst.with_name(f".{dst.name}.tmp")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _cache_evict() -> None:
+    # LRU por mtime (se toca en cada hit): borra lo más viejo hasta quedar bajo VOICE_CACHE_MB
+    try:
+        entries = [(e.stat().st_mtime, e.stat().st_size, e) for e in os.scandir(VOICE_CACHE_DIR) if not e.name.startswith(".")]
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    limit = VOICE_CACHE_MB * 1024 * 1024
+    for _, size, e in sorted(entries, key=lambda t: t[0]):
+        if total <= limit:
+            break
+        try:
+            os.unlink(e.path)
+            total -= size
+        except OSError:
+            pass
 
 
 def speak(text: str, out_m4a: Path, rate: int = DEFAULT_RATE) -> None:
-    out_m4a.parent.mkdir(parents=True, exist_ok=True)
+    """
+    Genera out_m4a con el primer motor disponible, o lo toma del cache si el
+    mismo motor/voz/texto ya se sintetizó.
+    El directorio de salida ya debe existir (lo crea main()).
+    """
+    if VOICE_CACHE_MB <= 0:
+        _synthesize(text, out_m4a, rate)
+        return
+
+    plan = _engine_plan(rate)
+    suffix = out_m4a.suffix.lower()
+    key = _cache_key(plan, suffix, text)
+    cached = VOICE_CACHE_DIR / f"{key}{suffix}"
+    if cached.exists():
+        try:
+            os.utime(cached)
+            _link_or_copy(cached, out_m4a)
+            print(f"TTS_ENGINE={plan[0]} cache=hit key={key[:12]}")
+            return
+        except OSError as e:
+            print(f"TTS_CACHE_FAILED error={e}")
 
+    # out_m4a puede ser hardlink de una entrada del cache: ffmpeg -y la truncaría
+    out_m4a.unlink(missing_ok=True)
+    engine = _synthesize(text, out_m4a, rate)
+
+    # solo se guarda si respondió el motor planificado (no el fallback de Piper -> espeak)
+    if engine == plan[0]:
+        try:
+            VOICE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            _link_or_copy(out_m4a, cached)
+            _cache_evict()
+        except OSError as e:
+            print(f"TTS_CACHE_FAILED error={e}")
+
+
+def _split_sentences(text: str):
+    if VOICE_PARALLEL <= 1:
+        return [text]
+    return [p for p in _SENTENCE_SPLIT_RE.split(text) if p.strip()]
+
+
+def _synth_parts(text: str, out_m4a: Path, synth_whole, synth_part, part_ext: str, copy_audio: bool = False) -> None:
+    """
+    Sintetiza cada oración en paralelo con synth_part (audio crudo del motor, sin
+    ffmpeg) y un solo ffmpeg concatena + codifica. Con una sola oración usa synth_whole.
+    """
+    parts = _split_sentences(text)
+    if len(parts) <= 1:
+        synth_whole(text, out_m4a)
+        return
+
+    tmp = Path(tempfile.mkdtemp(prefix=".parts_", dir=str(out_m4a.parent)))
+    try:
+        files = [tmp / f"part_{i:03d}{part_ext}" for i in range(len(parts))]
+        with ThreadPoolExecutor(max_workers=min(VOICE_PARALLEL, len(parts))) as pool:
+            list(pool.map(synth_part, parts, files))
+
+        listing = tmp / "list.txt"
+        listing.write_text("".join(f"file '{f.name}'\n" for f in files), encoding="utf-8")
+        _run_quiet(_ffmpeg_aac_cmd(["-f", "concat", "-safe", "0", "-i", str(listing)], out_m4a, copy_audio=copy_audio))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _synthesize(text: str, out_m4a: Path, rate: int) -> str:
+    """
+    Sintetiza out_m4a y retorna el motor que efectivamente se usó.
+    """
     # 1) Edge TTS (si está)
     if _have_edge_tts():
-        _edge_tts_to_m4a(text, out_m4a)
-        return
+        _synth_parts(text, out_m4a, _edge_tts_to_m4a, _edge_tts_to_mp3, ".mp3", copy_audio=EDGE_SKIP_REMUX)
+        print(
+            f"TTS_ENGINE=edge_tts voice={EDGE_VOICE} rate={_edge_rate_str(EDGE_RATE)} "
+            f"pitch={_edge_pitch_str(EDGE_PITCH)}"
+        )
+        return "edge_tts"
 
     # 2) macOS say
-    if sys.platform == "darwin" and Path("/usr/bin/say").exists():
+    if _caps().say:
         voice = _pick_spanish_voice()
-        aiff = out_m4a.with_suffix(".aiff")
-
         say_cmd = ["/usr/bin/say"]
         if voice:
             say_cmd += ["-v", voice]
-        say_cmd += ["-r", str(rate), text, "-o", str(aiff)]
-        subprocess.run(say_cmd, check=True)
+        say_cmd += ["-r", str(rate), text]
 
-        subprocess.run(["ffmpeg", "-y", "-i", str(aiff), str(out_m4a)], check=True)
-        aiff.unlink(missing_ok=True)
+        try:
+            # say escribe el m4a/AAC directo: sin AIFF temporal ni conversión aparte
+            _run_quiet(say_cmd + ["-o", str(out_m4a), "--file-format=m4af", "--data-format=aac", *_say_bitrate_args()])
+        except subprocess.CalledProcessError:
+            aiff = out_m4a.with_suffix(".aiff")
+            _run_quiet(say_cmd + ["-o", str(aiff)])
+            if _caps().afconvert:
+                _run_quiet([_caps().afconvert, str(aiff), str(out_m4a), "-f", "m4af", "-d", "aac", *_afconvert_bitrate_args()])
+            else:
+                _run_quiet([_caps().ffmpeg, "-y", "-hide_banner", "-loglevel", "error", "-i", str(aiff), str(out_m4a)])
+            aiff.unlink(missing_ok=True)
         print(f"TTS_ENGINE=macos_say voice={voice}")
-        return
-
-    # 3) Linux: Piper / espeak
-    wav = out_m4a.with_suffix(".wav")
+        return "macos_say"
 
+    # 3) Linux: Piper / espeak (TTS en pipe directo a ffmpeg)
     if _have_piper():
         try:
-            _piper_to_wav(text, wav)
-            _wav_to_m4a(wav, out_m4a)
-            wav.unlink(missing_ok=True)
+            _piper_to_m4a(text, out_m4a)
             print(f"TTS_ENGINE=piper model={PIPER_MODEL}")
-            return
+            return "piper"
         except Exception as e:
             print(f"TTS_ENGINE=piper_failed error={e}")
 
-    _espeak_to_wav(text, wav, rate=rate)
-    _wav_to_m4a(wav, out_m4a)
-    wav.unlink(missing_ok=True)
+    _synth_parts(
+        text,
+        out_m4a,
+        lambda t, f: _espeak_to_m4a(t, f, rate=rate),
+        lambda t, f: _espeak_to_wav(t, f, rate=rate),
+        ".wav",
+    )
     print(f"TTS_ENGINE=espeak voice={ESPEAK_VOICE}")
+    return "espeak"
 
 
 def main():
-    latest = json.loads(LATEST_JSON.read_text(encoding="utf-8"))
-    last_ok = _load_last_ok_anyhow()
-    data = _merge_with_fallback(latest, last_ok)
+    latest = _read_json(LATEST_JSON)
+    # caso normal: latest completo -> ni se importa fetch_finanzas_cl ni se lee last_ok
+    data = latest if _is_complete(latest) else _merge_with_fallback(latest, _load_last_ok_anyhow())
+
+    # en Linux/Render el camino esperado es Piper: si cae a espeak, que se note en el log
+    if sys.platform != "darwin" and not _have_edge_tts() and not _have_piper():
+        print(f"⚠️ Piper no disponible (USE_PIPER={int(USE_PIPER)} PIPER_MODEL={PIPER_MODEL or '-'}): se usará espeak")
 
-    Path("out").mkdir(exist_ok=True)
+    # una sola vez para todas las salidas (los paths son configurables por env)
+    for d in {p.parent for p in (OUT_FULL_M4A, OUT_SHORT_M4A, OUT_FULL_TXT, OUT_SHORT_TXT)}:
+        d.mkdir(parents=True, exist_ok=True)
 
     # ✅ FULL
     text_full = build_text_full(data)